@@ -1,6 +1,8 @@
 from typing import Optional
 from fastapi import APIRouter
 from fastapi.exceptions import HTTPException
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload
 from globals import DB_SESSION
 from provider.provider_list import mapping
 from schema.connections.provider import Provider
@@ -12,51 +14,53 @@ router = APIRouter(
 )
 
 @router.get("/")
-async def list_providers():
+def list_providers():
     with DB_SESSION() as session:   
-        providers = session.query(Provider).all()
+        providers = session.scalars(select(Provider)).all()
         return providers
 
 @router.get("/{provider_id}/get-form")
-async def get_provider_form(provider_id : str):
+def get_provider_form(provider_id : str):
     with DB_SESSION() as session:   
-        provider = session.query(Provider).filter_by(id=provider_id).first()
-        if(provider != None):
-            return provider.schema
+        # Only the schema column is needed
+        row = session.execute(select(Provider.schema).where(Provider.id == provider_id)).first()
+        if(row != None):
+            return row.schema
         raise HTTPException(status_code=404, detail=f"Provider {provider_id} not found.")
 
 @router.get("/{provider_id}/instances")
-async def list_instances(provider_id : str):
+def list_instances(provider_id : str):
     with DB_SESSION() as session:   
-        provider = session.query(Provider).filter_by(id=provider_id).first()
+        # Load the instances along with the provider, one query per collection instead of a lazy load
+        provider = session.get(Provider, provider_id, options=[selectinload(Provider.instances)])
         if(provider != None):
             return provider.instances
         raise HTTPException(status_code=404, detail=f"Provider {provider_id} not found.")
 
 @router.put("/{provider_id}/add")
-async def add_instance(provider_id : str, name : str, desc : str, data : dict):
+def add_instance(provider_id : str, name : str, desc : str, data : dict):
     with DB_SESSION() as session:   
-        provider = session.query(Provider).filter_by(id=provider_id).first()
+        provider = session.get(Provider, provider_id)
         if(provider != None):
             instance = ProviderInstance(name=name, desc=desc, data=data, provider=provider)
             session.add(instance)
             session.commit()
-            ProviderInstanceRegistry.instance().add(instance.id, mapping()[provider_id](instance.id))
+            ProviderInstanceRegistry.instance().add(instance.id, mapping()[provider_id](instance.id, instance))
         else:
             raise HTTPException(status_code=404, detail=f"Provider {provider_id} not found.")
 
 @router.get("/{provider_instance_id}")
-async def instance_info(provider_instance_id : int):
+def instance_info(provider_instance_id : int):
     with DB_SESSION() as session:
-        instance = session.query(ProviderInstance).filter_by(id=provider_instance_id).first()
+        instance = session.get(ProviderInstance, provider_instance_id)
         if(instance != None):
             return instance
         raise HTTPException(status_code=404, detail=f"Provider instance {provider_instance_id} not found.")
         
 @router.post("/{provider_instance_id}/update")
-async def update_instance(provider_instance_id : int, name : Optional[str], desc : Optional[str]):
+def update_instance(provider_instance_id : int, name : Optional[str], desc : Optional[str]):
     with DB_SESSION() as session:
-        instance = session.query(ProviderInstance).filter_by(id=provider_instance_id).first()
+        instance = session.get(ProviderInstance, provider_instance_id)
         if(instance != None):
             if(name != None):
                 instance.name = name
@@ -67,9 +71,9 @@ async def update_instance(provider_instance_id : int, name : Optional[str], desc
             raise HTTPException(status_code=404, detail=f"Provider instance {provider_instance_id} not found.")
 
 @router.delete("/{provider_instance_id}/remove")
-async def remove_instance(provider_instance_id : int):
+def remove_instance(provider_instance_id : int):
     with DB_SESSION() as session:
-        instance = session.query(ProviderInstance).filter_by(id=provider_instance_id).first()
+        instance = session.get(ProviderInstance, provider_instance_id)
         if(instance != None):
             ProviderInstanceRegistry.instance().remove(provider_instance_id)
             session.delete(instance)
@@ -1,8 +1,11 @@
 import os
 
 # EMBEDDINGS
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "sentence-transformers/paraphrase-MiniLM-L12-v2")
 EMBEDDING_DIMS = 768
-EMBEDDING_TOKEN_LIMIT = 1024
+# Model tokens per sentence group: the max_seq_length (128) of the embedding service minus the [CLS] and [SEP] tokens,
+# anything longer is truncated away before it is embedded
+EMBEDDING_TOKEN_LIMIT = int(os.getenv("EMBEDDING_TOKEN_LIMIT", "126"))
 
 # DATABASE
 PSQL_URL = os.getenv("PSQL_URL", "localhost")
@@ -18,7 +21,10 @@ CACHE_PATH = os.getenv("CACHE_PATH", os.path.join(HOME_DIR, ".cache", "kayf", "t
 LOGGING_PATH = f"{CACHE_PATH}/logs"
 
 # FETCHING TIME IN SECONDS -> how long wait until next fetch
-FETCHING_TIME = 60
+FETCHING_TIME = int(os.getenv("FETCHING_TIME", "60"))
 
 # HOW MANY THREADS SHOULD FETCH PROVIDER INSTANCES
-FETCHING_THREADS = 5
+FETCHING_THREADS = int(os.getenv("FETCHING_THREADS", "5"))
+
+# HOW MANY THREADS SHOULD PROCESS FETCHED DOCUMENTS PER PROVIDER INSTANCE
+PROCESSING_THREADS = int(os.getenv("PROCESSING_THREADS", "8"))
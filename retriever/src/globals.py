@@ -3,12 +3,33 @@ from sqlalchemy.orm import sessionmaker
 from env import PSQL_DB, PSQL_PASSWORD, PSQL_PORT, PSQL_URL, PSQL_USERNAME
 from schema.base import Base
 import logging
+import threading
 
 ## LOGGING
 LOGGER = logging.getLogger(__name__)
 
 ## DB ##
 
-DB_ENGINE = create_engine(f"postgresql+psycopg://{PSQL_USERNAME}:{PSQL_PASSWORD}@{PSQL_URL}:{PSQL_PORT}/{PSQL_DB}")
-Base.metadata.create_all(DB_ENGINE)
-DB_SESSION = sessionmaker(bind = DB_ENGINE)
+# Bulk INSERT ... RETURNING statements send up to 5000 rows per round-trip.
+# A document row has 9 parameters, which keeps even those pages below PostgreSQL's limit of 65535 bind parameters.
+DB_ENGINE = create_engine(
+    f"postgresql+psycopg://{PSQL_USERNAME}:{PSQL_PASSWORD}@{PSQL_URL}:{PSQL_PORT}/{PSQL_DB}",
+    insertmanyvalues_page_size=5000
+)
+# Objects stay usable after commit, without another round-trip to reload their attributes
+DB_SESSION = sessionmaker(bind = DB_ENGINE, expire_on_commit=False)
+
+_DB_INITIALIZED = False
+_DB_INIT_LOCK = threading.Lock()
+
+def init_db():
+    """
+    Creates the missing database tables. Only the first call reaches the database, later calls return immediately.
+
+    Must be called after all schema modules have been imported, so their tables are registered on `Base.metadata`.
+    """
+    global _DB_INITIALIZED
+    with _DB_INIT_LOCK:
+        if not _DB_INITIALIZED:
+            Base.metadata.create_all(DB_ENGINE)
+            _DB_INITIALIZED = True
@@ -1,19 +1,15 @@
 from contextlib import asynccontextmanager
 from env import LOGGING_PATH
-from globals import LOGGER
+from globals import LOGGER, init_db
 from provider.provider_list import load_providers
 from fastapi import FastAPI
 from api import router
 from provider.provider_queue import ProviderQueue
 from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
 import logging
 import os
-import nltk
-
-nltk.download('punkt_tab')
-nltk.download('punkt')
-nltk.download('wordnet')
-nltk.download('omw-1.4')
+import queue
 
 # KAYF TRACER DATA RETRIEVER
 
@@ -39,19 +35,32 @@ async def lifespan(app: FastAPI):
     file_handler.setLevel(logging.ERROR)  # Handle ERROR and above
     file_handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
 
+    # Hand error logs over to a background thread via a queue, so logging threads never wait on the file.
+    # Records are written as they arrive, so they are on disk even if the process crashes.
+    log_queue = queue.Queue(-1)
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.setLevel(logging.ERROR)  # Handle ERROR and above
+    queue_listener = QueueListener(log_queue, file_handler, respect_handler_level=True)
+
     # Add the handlers to the logger
     logger.addHandler(console_handler)
-    logger.addHandler(file_handler)
+    logger.addHandler(queue_handler)
+    queue_listener.start()
 
     # Disable access and ASGI logs from uvicorn
     logging.getLogger("uvicorn.access").disabled = True
     logging.getLogger("uvicorn.asgi").disabled = True
     
+    init_db()
     ProviderQueue.instance().start()
     load_providers()
     yield
     ProviderQueue.instance().stop()
 
+    # Write out all queued logs
+    queue_listener.stop()
+    file_handler.close()
+
 app = FastAPI(lifespan=lifespan)
 
 app.include_router(router)
@@ -1,42 +1,118 @@
-from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 
+from env import PROCESSING_THREADS
 from globals import LOGGER
 from provider.generic_provider import GenericProvider
 import imaplib
 import email
+import email.policy
 import email.utils
-from email.header import decode_header
-from typing import List, Dict, Optional
+import re
+import time
+from typing import Iterator, List, Dict, Optional, Tuple
 from provider.parser.cleanup import clean_up
 from provider.parser.markup_parser import html_to_plain, markdown_to_plain
-from provider.utils.pipeline import pipeline
+from provider.utils.pipeline import PreprocessedDocument, persist, preprocess
 from provider.utils.text_type_detector import TextType, detect_text_type
 
+# Maximum number of messages requested with a single FETCH command
+_FETCH_CHUNK_SIZE = 500
+
+# Timestamp of instances that haven't been fetched yet
+_UTC_MIN = datetime.min.replace(tzinfo=timezone.utc)
+
+# IMAP search criteria for incremental fetches
+_SEARCH_FMT = "(SINCE {date})"
+
+# SINCE compares against dates in the server's timezone, so the search starts a day early.
+# The INTERNALDATE prefilter in `run()` drops the messages that were already fetched.
+_SEARCH_MARGIN = timedelta(days=1)
+
+# Socket timeout in seconds, so an unresponsive server can't block a fetching thread indefinitely
+_SOCKET_TIMEOUT = 30
+
+_UID_RE = re.compile(rb"UID (\d+)")
+
+def _chunked(uids: List[bytes]) -> Iterator[str]:
+    """Yields comma separated UID sets of at most `_FETCH_CHUNK_SIZE` UIDs, as str since imaplib takes str arguments."""
+    for i in range(0, len(uids), _FETCH_CHUNK_SIZE):
+        yield ",".join(uid.decode() for uid in uids[i:i + _FETCH_CHUNK_SIZE])
+
+def _chunked_by_arrival(arrival_dates: Dict[bytes, datetime]) -> Iterator[Tuple[str, datetime]]:
+    """Yields comma separated UID sets of about `_FETCH_CHUNK_SIZE` UIDs in arrival order, each with the newest arrival date in it.
+
+    A set never ends between two messages that arrived at the same time, so every message newer than that date is in a later set.
+    """
+    chunk: List[str] = []
+    newest = _UTC_MIN
+    for uid, arrival_date in sorted(arrival_dates.items(), key=lambda item: item[1]):
+        if len(chunk) >= _FETCH_CHUNK_SIZE and arrival_date != newest:
+            yield ",".join(chunk), newest
+            chunk = []
+        chunk.append(uid.decode())
+        newest = arrival_date
+
+    if chunk:
+        yield ",".join(chunk), newest
+
+def _parse_uid(response: bytes) -> Optional[bytes]:
+    """Extracts the UID from a FETCH response line."""
+    match = _UID_RE.search(response)
+    return match.group(1) if match else None
+
+def _parse_internaldate(response: bytes) -> Optional[datetime]:
+    """Extracts the INTERNALDATE (the time the server received the message) from a FETCH response line."""
+    internaldate = imaplib.Internaldate2tuple(response)
+    if internaldate is None:
+        return None
+    return datetime.fromtimestamp(time.mktime(internaldate), tz=timezone.utc)
+
+def _decode_part(part) -> Optional[str]:
+    """Decodes the payload of a message part, replacing undecodable bytes."""
+    payload = part.get_payload(decode=True)
+    if payload is None:
+        return None
+
+    charset = part.get_content_charset() or 'utf-8'
+    try:
+        return payload.decode(charset, errors="replace")
+    except LookupError as e:
+        LOGGER.error(f"Unknown charset {charset}, falling back to utf-8: {e}")
+        return payload.decode('utf-8', errors="replace")
+
 def _get_email_body(msg) -> Optional[str]:
-    """Extracts the body from the email message."""
-    # If the email message is multipart
-    if msg.is_multipart():
-        for part in msg.walk():
-            if part.get_content_type() in ["text/plain", "text/html"]:
-                charset = part.get_content_charset() or 'utf-8'
-                payload = part.get_payload(decode=True)
-                try:
-                    return payload.decode(charset)
-                except (UnicodeDecodeError, TypeError) as e:
-                    LOGGER.error(f"Decoding error for {charset}: {e}")
-                    return None
-    else:
-        # If the email is not multipart
-        charset = msg.get_content_charset() or 'utf-8'
-        payload = msg.get_payload(decode=True)
-        try:
-            return payload.decode(charset)
-        except (UnicodeDecodeError, TypeError) as e:
-            LOGGER.error(f"Decoding error for {charset}: {e}")
-            return None
-    
+    """Extracts the body from the email message, preferring plain text over HTML."""
+    # If the email is not multipart
+    if not msg.is_multipart():
+        return _decode_part(msg)
+
+    # Walk the parts once, returning the first plain text part and remembering the first HTML part as fallback
+    html_part = None
+    for part in msg.walk():
+        if part.get_content_disposition() == "attachment":
+            continue
+
+        content_type = part.get_content_type()
+        if content_type == "text/plain":
+            return _decode_part(part)
+        if content_type == "text/html" and html_part is None:
+            html_part = part
+
+    if html_part is not None:
+        return _decode_part(html_part)
     return None
 
+def _header_value(msg, name: str) -> str:
+    """Returns a header of the email message as text. The default policy already decodes encoded words and raw 8-bit values."""
+    value = msg.get(name)
+    return str(value) if value else ""
+
+def _get_sender(msg) -> str:
+    """Extracts the sender of the email message as "Name <address>", or just the address if there is no name."""
+    name, address = email.utils.parseaddr(_header_value(msg, "From"))
+    return f"{name} <{address}>" if name else address
+
 class ImapProvider(GenericProvider):
     """Provider implementation for handling IMAP email fetching."""
 
@@ -50,6 +126,8 @@ class ImapProvider(GenericProvider):
         "password": "text"
     }
 
+    _mail: Optional[imaplib.IMAP4_SSL] = None
+
     def _setup(self) -> bool:
         """Establishes a connection to the IMAP server.
 
@@ -57,10 +135,25 @@ class ImapProvider(GenericProvider):
             bool: True if the setup was successful, False otherwise.
         """
         data = self.data
-        self._mail = imaplib.IMAP4_SSL(data['connection'])
-        self._mail.login(data['user'], data['password'])
+        try:
+            self._mail = imaplib.IMAP4_SSL(data['connection'], timeout=_SOCKET_TIMEOUT)
+            self._mail.login(data['user'], data['password'])
+        except (imaplib.IMAP4.error, OSError) as e:
+            LOGGER.error(f"Connecting to the IMAP server failed: {e}")
+            self._reset_connection()
+            return False
         return True
 
+    def _reset_connection(self) -> None:
+        """Closes a broken or half-read connection, so the next run connects again instead of reusing it."""
+        if self._mail is not None:
+            try:
+                self._mail.shutdown()
+            except OSError:
+                pass
+            self._mail = None
+        self._setup_completed = False
+
     def run(self) -> bool:
         """Fetches emails from the IMAP inbox.
 
@@ -71,44 +164,67 @@ class ImapProvider(GenericProvider):
             return False
 
         last_fetched = self.last_fetched
-        if last_fetched is None:
+        if last_fetched is None or self._mail is None:
             return False
 
-        self._mail.select("inbox")
-        utc_min_datetime = datetime.min.replace(tzinfo=timezone.utc)
-
-        search_criteria = "ALL" if last_fetched == utc_min_datetime else f"(SINCE {last_fetched.strftime('%d-%b-%Y')})"
+        search_criteria = "ALL" if last_fetched == _UTC_MIN else _SEARCH_FMT.format(date=(last_fetched - _SEARCH_MARGIN).strftime('%d-%b-%Y'))
         initiated_at = datetime.now(tz=timezone.utc)
 
         try:
-            _, data = self._mail.search(None, search_criteria)
-            email_ids = data[0].split()
-            emails: List[Dict] = []
+            self._mail.select("inbox")
+            _, data = self._mail.uid("SEARCH", search_criteria)
+            uids = data[0].split()
 
-            for email_id in email_ids:
-                # Fetch the email by ID
-                _, message_data = self._mail.fetch(email_id, "(RFC822)")
+            # Fetch the arrival dates first, so only messages received after the last fetch are downloaded.
+            # SINCE only has day granularity and would otherwise transfer bodies that are discarded.
+            arrival_dates: Dict[bytes, datetime] = {}
+            for uid_set in _chunked(uids):
+                _, date_data = self._mail.uid("fetch", uid_set, "(INTERNALDATE)")
 
-                for response_part in message_data:
+                for response_part in date_data:
                     if isinstance(response_part, tuple):
-                        msg = email.message_from_bytes(response_part[1])
-
-                        # Decode email subject
-                        subject, encoding = decode_header(msg["Subject"])[0]
-                        if isinstance(subject, bytes):
-                            subject = subject.decode(encoding if encoding else "utf-8")
+                        response_part = response_part[0]
+                    if not isinstance(response_part, bytes):
+                        continue
 
-                        # Get sender
-                        from_ = msg.get("From")
+                    uid = _parse_uid(response_part)
+                    arrival_date = _parse_internaldate(response_part)
+                    if uid is not None and arrival_date is not None and arrival_date > last_fetched:
+                        arrival_dates[uid] = arrival_date
 
-                        # Parse the email date
-                        date = msg.get("Date")
-                        email_date = email.utils.parsedate_to_datetime(date)
+            # Fetch, process and persist the messages chunk by chunk, so only one chunk of emails is held in memory at a time.
+            # One FETCH per chunk avoids a round-trip per email, BODY.PEEK[] leaves the \Seen flag untouched.
+            newest_fetched = _UTC_MIN
+            with ThreadPoolExecutor(max_workers=PROCESSING_THREADS) as executor:
+                for uid_set, fetched_until in _chunked_by_arrival(arrival_dates):
+                    _, message_data = self._mail.uid("fetch", uid_set, "(BODY.PEEK[])")
+                    emails: List[Dict] = []
 
-                        if email_date is None:
+                    for response_part in message_data:
+                        if not isinstance(response_part, tuple):
                             continue
 
-                        if email_date > last_fetched:
+                        # A single malformed message is skipped, it must not fail the chunk and with it every later run
+                        try:
+                            msg = email.message_from_bytes(response_part[1], policy=email.policy.default)
+
+                            # Decode email subject
+                            subject = _header_value(msg, "Subject")
+
+                            # Get sender
+                            from_ = _get_sender(msg)
+
+                            # Parse the email date, falling back to the arrival date if it is missing or malformed
+                            try:
+                                email_date = email.utils.parsedate_to_datetime(msg.get("Date"))
+                            except (TypeError, ValueError):
+                                email_date = None
+
+                            uid = _parse_uid(response_part[0])
+                            email_date = email_date or (arrival_dates.get(uid) if uid is not None else None)
+                            if email_date is None:
+                                continue
+
                             # Add email details to the list
                             emails.append({
                                 "subject": subject,
@@ -116,17 +232,29 @@ class ImapProvider(GenericProvider):
                                 "date": email_date,
                                 "body": _get_email_body(msg)
                             })
+                        except Exception as e:
+                            LOGGER.error(f"Skipping malformed message {response_part[0]!r}: {e}")
 
-            for mail in emails:
-                text = mail["body"]
-                text = clean_up(text)               
-                docs = pipeline(text, self.id, 'Email', "", mail["subject"], mail["from"], self._AVATAR, '', '', mail["date"])
-                for doc in docs:
-                    print(doc.id, doc.data)
+                    # Overlap parsing with the I/O-bound translation of other emails
+                    preprocessed = [doc for doc in executor.map(self._preprocess_email, emails) if doc is not None]
 
-            self.update_last_fetched(initiated_at)
+                    for docs in persist(preprocessed):
+                        for doc in docs:
+                            print(doc.id, doc.data)
+
+                    # Record the progress, so a failure in a later chunk doesn't persist this one again on the next run
+                    self.update_last_fetched(fetched_until)
+                    newest_fetched = fetched_until
+
+            # The arrival dates come from the server clock and can be later than initiated_at, the timestamp must never move backwards
+            self.update_last_fetched(max(initiated_at, newest_fetched))
             return True
 
+        except (imaplib.IMAP4.abort, OSError) as e:
+            # Timeouts and dropped connections leave the stream out of sync, so it can't be used for the next run
+            LOGGER.error(f"IMAP connection failed: {e}")
+            self._reset_connection()
+            return False
         except imaplib.IMAP4.error as e:
             LOGGER.error(f"IMAP error occurred: {e}")
             return False
@@ -134,6 +262,22 @@ class ImapProvider(GenericProvider):
             LOGGER.error(f"An unexpected error occurred: {e}")
             return False
 
+    def _preprocess_email(self, mail: Dict) -> Optional[PreprocessedDocument]:
+        """Cleans up an email body and runs it through the text processing steps of the pipeline.
+
+        Args:
+            mail (Dict): The email details as collected by `run()`.
+
+        Returns:
+            Optional[PreprocessedDocument]: The preprocessed email, or None if it has no body.
+        """
+        text = mail["body"]
+        if text is None:
+            return None
+
+        text = clean_up(text)
+        return preprocess(text, self.id, 'Email', "", mail["subject"], mail["from"], self._AVATAR, '', '', mail["date"])
+
     def _clean_up(self) -> None:
         """Logs out from the IMAP server."""
         if self._setup_completed is False:
@@ -1,6 +1,7 @@
-from typing import Optional
+from typing import Optional, cast
 from abc import ABC, abstractmethod
 from datetime import datetime, timezone
+from sqlalchemy import CursorResult, update
 from globals import DB_SESSION, LOGGER
 from schema.connections.provider_instance import ProviderInstance
 from schema.connections.provider import Provider
@@ -18,11 +19,12 @@ class GenericProvider(ABC):
     _AVATAR = ""
     _SCHEMA = {}
 
-    def __init__(self, id: int) -> None:
+    def __init__(self, id: int, instance: Optional[ProviderInstance] = None) -> None:
         """Initializes a GenericProvider instance.
 
         Args:
             id (int): The ID of the provider instance.
+            instance (Optional[ProviderInstance]): The already loaded database row of the provider instance. It is queried if omitted.
 
         Raises:
             LookupError: If the provider instance with the given ID is not found.
@@ -30,15 +32,18 @@ class GenericProvider(ABC):
         self._id = id
         self._status = True
         self._last_indexed = datetime.min.replace(tzinfo=timezone.utc)
+        self._last_fetched: Optional[datetime] = None
         self._setup_completed = False
 
-        with DB_SESSION() as session:
-            instance = session.query(ProviderInstance).filter_by(id=self._id).first()
-            if instance is not None:
-                self._data = instance.data
-            else:
-                session.close()
-                raise LookupError(f"Provider instance with ID {id} not found.")
+        if instance is None:
+            with DB_SESSION() as session:
+                instance = session.get(ProviderInstance, self._id)
+        if instance is None:
+            raise LookupError(f"Provider instance with ID {id} not found.")
+
+        self._data = instance.data
+        # The provider object is the only writer of last_fetched, so it can be cached
+        self._last_fetched = instance.last_fetched.replace(tzinfo=timezone.utc)
         
         LOGGER.info(f"Created provider object for {self._id}.")
 
@@ -93,16 +98,12 @@ class GenericProvider(ABC):
 
     @property
     def last_fetched(self) -> Optional[datetime]:
-        """Gets the last fetched timestamp from the database.
+        """Gets the last fetched timestamp, cached from the database.
 
         Returns:
             Optional[datetime]: The last fetched timestamp, or None if not found.
         """
-        with DB_SESSION() as session:
-            instance = session.query(ProviderInstance).filter_by(id=self._id).first()
-            if instance is not None:
-                return instance.last_fetched.replace(tzinfo=timezone.utc)
-            return None
+        return self._last_fetched
 
     @property
     def last_indexed(self) -> datetime:
@@ -128,12 +129,15 @@ class GenericProvider(ABC):
         Args:
             time (Optional[datetime]): The new last fetched time, or None to set to now.
         """
+        time = time or datetime.now(tz=timezone.utc)
         with DB_SESSION() as session:
-            instance = session.query(ProviderInstance).filter_by(id=self._id).first()
-            if instance is not None:
-                instance.last_fetched = time or datetime.now(tz=timezone.utc)
-                session.commit()
+            # An UPDATE returns a CursorResult, which carries the rowcount the generic Result type lacks
+            result = cast(CursorResult, session.execute(update(ProviderInstance).where(ProviderInstance.id == self._id).values(last_fetched=time)))
+            session.commit()
+            if result.rowcount > 0:
+                self._last_fetched = time
             else:
+                self._last_fetched = None
                 LOGGER.error(f"No matching provider instance found with key {self._id}. Can't update timestamp.")
 
     def update_last_indexed(self) -> None:
@@ -1,13 +1,21 @@
-from bs4 import BeautifulSoup
+from typing import List
+from markdown_it import MarkdownIt
+from markdown_it.token import Token
+from selectolax.lexbor import LexborHTMLParser
 import re
-import markdown
+
+_HEADING_TAGS = {"h1", "h2", "h3", "h4", "h5", "h6"}
+# Subtrees that never contribute readable content
+_IGNORED_TAGS = ["head", "script", "style", "noscript", "template", "svg", "img"]
+_MULTI_NEWLINE_RE = re.compile(r"\n\s*\n")
+_MARKDOWN = MarkdownIt()
 
 def html_to_plain(html: str) -> str:
     """
     Converts HTML to a readable plain text format.
 
-    This function processes an HTML string and converts it into a plain text format by:
-    - Converting headings into "Heading: Content" format.
+    This function parses an HTML string and converts it into a plain text format in a single DOM traversal by:
+    - Converting headings into "Heading:" lines.
     - Converting lists into a plain text format (removing dashes or numbers).
     - Removing images.
     - Converting hyperlinks to "Text (URL)" format.
@@ -26,55 +34,83 @@ def html_to_plain(html: str) -> str:
     Item 1
     Item 2
     """
-    soup = BeautifulSoup(html, "html.parser")
-
-    # Remove script and style elements
-    for script in soup(["script", "style"]):
-        script.extract()
-
-    # Get all text from headings and replace them with "Heading: Content"
-    for header in soup.find_all(re.compile("^h[1-6]$")):
-        content = header.get_text(strip=True)
-        if header.find_next_sibling():
-            next_content = header.find_next_sibling().get_text(strip=True)
-            header.replace_with(f"{content}: {next_content}\n")
-        else:
-            header.replace_with(f"{content}:\n")
-
-    # Convert lists into plain text (no dashes or numbers)
-    for ul in soup.find_all("ul"):
-        items = [li.get_text(strip=True) for li in ul.find_all("li")]
-        ul.replace_with("\n".join(items) + "\n")
-
-    for ol in soup.find_all("ol"):
-        items = [li.get_text(strip=True) for li in ol.find_all("li")]
-        ol.replace_with("\n".join(items) + "\n")
-
-    # Convert links to "Text (URL)"
-    for a in soup.find_all("a", href=True):
-        text = a.get_text(strip=True)
-        href = a["href"]
-        a.replace_with(f"{text} ({href})")
-
-    # Remove images
-    for img in soup.find_all("img"):
-        img.extract()
-
-    # Convert remaining HTML to plain text
-    plain_text = soup.get_text(separator="\n", strip=True)
+    tree = LexborHTMLParser(html)
+
+    # Remove script, style, image and other non-content subtrees before walking the tree
+    tree.strip_tags(_IGNORED_TAGS)
+
+    root = tree.body or tree.root
+    if root is None:
+        return ""
+
+    parts: List[str] = []
+
+    # Walk the DOM once in document order. An explicit stack is used since email HTML tends to be deeply nested.
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        tag = node.tag
+
+        if tag == "-text":
+            text = node.text(strip=True)
+            if text:
+                parts.append(text)
+        elif tag in _HEADING_TAGS:
+            # Convert headings into "Heading:"
+            parts.append(f"{node.text(strip=True)}:")
+        elif tag == "li":
+            # List items end up on their own line (no dashes or numbers)
+            parts.append(node.text(strip=True))
+        elif tag == "a" and node.attributes.get("href"):
+            # Convert links to "Text (URL)"
+            parts.append(f"{node.text(strip=True)} ({node.attributes['href']})")
+        elif tag != "-comment":
+            stack.extend(reversed(list(node.iter(include_text=True))))
+
+    plain_text = "\n".join(parts)
 
     # Replace multiple newlines with a single one
-    plain_text = re.sub(r"\n\s*\n", "\n", plain_text)
+    plain_text = _MULTI_NEWLINE_RE.sub("\n", plain_text)
 
     return plain_text
 
+def _inline_to_plain(token: Token) -> str:
+    """
+    Converts an inline Markdown token into plain text.
+
+    Links are converted to "Text (URL)", images and inline HTML are removed.
+
+    Parameters:
+    token (Token): An inline token as produced by markdown-it.
+
+    Returns:
+    str: The plain text of the inline token.
+    """
+    parts: List[str] = []
+    hrefs: List[str] = []
+
+    for child in token.children or []:
+        if child.type in ("text", "code_inline"):
+            parts.append(child.content)
+        elif child.type in ("softbreak", "hardbreak"):
+            parts.append("\n")
+        elif child.type == "link_open":
+            hrefs.append(str(child.attrGet("href") or ""))
+        elif child.type == "link_close" and hrefs:
+            href = hrefs.pop()
+            if href:
+                parts.append(f" ({href})")
+
+    return "".join(parts).strip()
+
 def markdown_to_plain(md: str) -> str:
     """
     Converts Markdown text to plain text format.
 
-    This function first converts the provided Markdown string to HTML using the 
-    markdown library, and then processes the resulting HTML with the 
-    html_to_plain function to produce a plain text representation.
+    This function parses the provided Markdown string with markdown-it and walks 
+    the resulting token stream once, emitting headings as "Heading:", list items 
+    and paragraphs on their own lines and links as "Text (URL)". Embedded HTML 
+    blocks are converted with the html_to_plain function.
 
     Parameters:
     md (str): A string containing Markdown content.
@@ -90,5 +126,26 @@ def markdown_to_plain(md: str) -> str:
     List item 2
     Link (http://example.com)
     """
-    html = markdown.markdown(md)
-    return html_to_plain(html)
+    lines: List[str] = []
+    in_heading = False
+
+    for token in _MARKDOWN.parse(md):
+        if token.type == "heading_open":
+            in_heading = True
+        elif token.type == "heading_close":
+            in_heading = False
+        elif token.type == "inline":
+            text = _inline_to_plain(token)
+            if text:
+                lines.append(f"{text}:" if in_heading else text)
+        elif token.type in ("fence", "code_block"):
+            lines.append(token.content.strip())
+        elif token.type == "html_block":
+            lines.append(html_to_plain(token.content))
+
+    plain_text = "\n".join(line for line in lines if line)
+
+    # Replace multiple newlines with a single one
+    plain_text = _MULTI_NEWLINE_RE.sub("\n", plain_text)
+
+    return plain_text
@@ -1,12 +1,13 @@
 
 from abc import ABC, abstractmethod
 from enum import Enum
-from typing import Dict, Optional, Type, List
+from typing import Dict, Optional, Type, Tuple
 from threading import Lock
 
+from sqlalchemy import select
 from provider.generic_provider import GenericProvider
 from globals import DB_SESSION
-from schema.connections.provider import Provider
+from schema.connections.provider_instance import ProviderInstance
 
 class ProviderInstanceRegistryEvent(Enum):
     """Enum for events that notify observers of changes in the ProviderInstanceRegistry."""
@@ -27,12 +28,12 @@ class ProviderInstanceRegistryObserver(ABC):
 
 class ProviderInstanceRegistry:
     """Singleton registry for managing provider instances and notifying observers of changes."""
-    _GLOBAL_INSTANCE: Optional["ProviderInstanceRegistry"] = None
+    _GLOBAL_INSTANCE: "ProviderInstanceRegistry"  # Created once at import time, see the end of the module
 
     def __init__(self) -> None:
         self._registry: Dict[int, GenericProvider] = {}
-        self._observers: List[ProviderInstanceRegistryObserver] = []
-        self._lock = Lock()  # Lock for thread safety
+        self._observers: Tuple[ProviderInstanceRegistryObserver, ...] = ()  # Replaced on change, so it can be read without the lock
+        self._lock = Lock()  # Serializes writers, readers don't need it
 
     @staticmethod
     def instance() -> "ProviderInstanceRegistry":
@@ -41,8 +42,6 @@ class ProviderInstanceRegistry:
         Returns:
             ProviderInstanceRegistry: The singleton instance.
         """
-        if ProviderInstanceRegistry._GLOBAL_INSTANCE is None:
-            ProviderInstanceRegistry._GLOBAL_INSTANCE = ProviderInstanceRegistry()
         return ProviderInstanceRegistry._GLOBAL_INSTANCE
 
     def attach(self, observer: ProviderInstanceRegistryObserver) -> None:
@@ -52,7 +51,7 @@ class ProviderInstanceRegistry:
             observer (ProviderInstanceRegistryObserver): The observer to attach.
         """
         with self._lock:  # Ensure thread safety when modifying observers
-            self._observers.append(observer)
+            self._observers = self._observers + (observer,)
 
     def detach(self, observer: ProviderInstanceRegistryObserver) -> None:
         """Detaches an observer from the registry.
@@ -61,10 +60,12 @@ class ProviderInstanceRegistry:
             observer (ProviderInstanceRegistryObserver): The observer to detach.
         """
         with self._lock:  # Ensure thread safety when modifying observers
-            self._observers.remove(observer)
+            observers = list(self._observers)
+            observers.remove(observer)
+            self._observers = tuple(observers)
 
     def _notify_all(self, event: ProviderInstanceRegistryEvent, target: int) -> None:
-        """Notifies all observers of a registry event.
+        """Notifies all observers of a registry event. Must be called without holding the lock.
 
         Args:
             event (ProviderInstanceRegistryEvent): The event that occurred.
@@ -97,12 +98,14 @@ class ProviderInstanceRegistry:
             key (int): The ID of the provider instance to remove.
         """
         with self._lock:  # Ensure thread safety when modifying the registry
-            if key not in self._registry:
-                return
+            provider = self._registry.pop(key, None)
 
-            self._registry[key].kill()
-            self._registry.pop(key)
-            self._notify_all(ProviderInstanceRegistryEvent.REMOVE, key)
+        if provider is None:
+            return
+
+        # Killing may block on network I/O and observers may re-enter the registry, so neither happens under the lock
+        provider.kill()
+        self._notify_all(ProviderInstanceRegistryEvent.REMOVE, key)
 
     def get(self, key: int) -> Optional[GenericProvider]:
         """Retrieves a provider instance by its ID.
@@ -113,8 +116,8 @@ class ProviderInstanceRegistry:
         Returns:
             Optional[GenericProvider]: The provider instance, or None if not found.
         """
-        with self._lock:  # Ensure thread safety when accessing the registry
-            return self._registry.get(key, None)
+        # Reads don't take the lock: a single dict lookup is atomic and writers only ever insert or pop whole entries
+        return self._registry.get(key, None)
 
     def load_instances(self, cls: Type[GenericProvider]) -> None:
         """Loads provider instances of a given class from the database and adds them to the registry.
@@ -122,9 +125,12 @@ class ProviderInstanceRegistry:
         Args:
             cls (Type[GenericProvider]): The class of the provider to load instances for.
         """
+        # One query for all instances, the loaded rows are handed to the providers so they don't query them again
         with DB_SESSION() as session:
-            provider = session.query(Provider).filter_by(id=cls.provider_id()).first()
-            if provider is not None:
-                instances = provider.instances
-                for instance in instances:
-                    self.add(instance.id, cls(instance.id))
+            instances = session.scalars(select(ProviderInstance).where(ProviderInstance.provider_id == cls.provider_id())).all()
+
+        for instance in instances:
+            self.add(instance.id, cls(instance.id, instance))
+
+# Module imports are serialized by the import lock, so this can't race like a lazily created instance
+ProviderInstanceRegistry._GLOBAL_INSTANCE = ProviderInstanceRegistry()
@@ -17,17 +17,13 @@ def load_providers() -> None:
         p.register_provider()
         ProviderInstanceRegistry.instance().load_instances(p)
 
-internal_mapping: Dict[str, Type[GenericProvider]] = {}
+# Provider IDs mapped to their provider classes, built once at import since PROVIDERS never changes at runtime
+_MAPPING: Dict[str, Type[GenericProvider]] = {p.provider_id(): p for p in PROVIDERS}
 
 def mapping() -> Dict[str, Type[GenericProvider]]:
-    """Creates and returns a mapping of provider IDs to their corresponding provider classes.
-
-    If the mapping has not been created yet, it initializes it by iterating through the PROVIDERS list.
+    """Returns a mapping of provider IDs to their corresponding provider classes.
 
     Returns:
         Dict[str, Type[GenericProvider]]: A dictionary mapping provider IDs to provider classes.
     """
-    if len(internal_mapping) == 0:
-        for p in PROVIDERS:
-            internal_mapping[p.provider_id()] = p
-    return internal_mapping
+    return _MAPPING
@@ -1,19 +1,21 @@
 from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
-from threading import Thread, Condition
-from typing import Tuple
+from threading import Thread, Condition, Lock
+from typing import Dict, List, Optional, Tuple
 from sortedcontainers import SortedList
 from env import FETCHING_THREADS, FETCHING_TIME
 from globals import LOGGER
+from provider.generic_provider import GenericProvider
 from provider.provider_instance_registry import ProviderInstanceRegistry, ProviderInstanceRegistryEvent, ProviderInstanceRegistryObserver
 
 class ProviderQueue(ProviderInstanceRegistryObserver):
     """ 
     The ProviderQueue manages all provider instances and is responsible for executing the run-functions.
     The class manages a list of the instances sorted after their last execution date and attempts to reduce CPU time by introducing smart waiting mechanisms.
+    Only the queue thread ever waits on the condition, so a single notify() always reaches it.
     """
     
-    _GLOBAL_INSTANCE = None
+    _GLOBAL_INSTANCE: 'ProviderQueue'  # Created once at import time, see the end of the module
 
     def __init__(self, instance_registry: ProviderInstanceRegistry) -> None:
         """Initializes the ProviderQueue with the provided instance registry.
@@ -22,24 +24,23 @@ class ProviderQueue(ProviderInstanceRegistryObserver):
             instance_registry (ProviderInstanceRegistry): The registry of provider instances.
         """
         self._provider_instances = SortedList()
+        self._entries: Dict[int, Tuple[datetime, int]] = {}  # Queued entry per provider instance ID, mirrors _provider_instances
         self._instance_registry = instance_registry
         self._instance_registry.attach(self)
         self._status = True
         self._thread = Thread(target=self.run, daemon=True)
         
-        self._condition = Condition()
+        self._condition = Condition(Lock())  # Never re-entered, so a plain Lock is enough and cheaper than the default RLock
         self._active_tasks = 0  # Track running tasks
 
     @staticmethod
     def instance() -> 'ProviderQueue':
         """ 
-        Returns the singleton instance of ProviderQueue. Creates it if it does not exist.
+        Returns the singleton instance of ProviderQueue.
 
         Returns:
             ProviderQueue: The singleton instance of the ProviderQueue.
         """
-        if ProviderQueue._GLOBAL_INSTANCE is None:
-            ProviderQueue._GLOBAL_INSTANCE = ProviderQueue(ProviderInstanceRegistry.instance())
         return ProviderQueue._GLOBAL_INSTANCE
 
     def notify(self, event: ProviderInstanceRegistryEvent, target: int) -> None:
@@ -49,17 +50,20 @@ class ProviderQueue(ProviderInstanceRegistryObserver):
             event (ProviderInstanceRegistryEvent): The event indicating a change in the provider instance.
             target (int): The ID of the provider instance affected by the event.
         """
-        with self._condition:
-            if event == ProviderInstanceRegistryEvent.ADD:
-                provider_instance = self._instance_registry.get(target)
-                if provider_instance:
-                    last_fetched = provider_instance.last_fetched or datetime.min
-                    self._provider_instances.add((last_fetched, target))
+        if event == ProviderInstanceRegistryEvent.ADD:
+            # Queried before entering the condition, so the critical section stays short
+            provider_instance = self._instance_registry.get(target)
+            if provider_instance:
+                last_fetched = provider_instance.last_fetched
+                if last_fetched is None:
+                    LOGGER.error(f'Provider instance {target} has no last fetched timestamp, not queueing it.')
+                    return
+                with self._condition:
+                    self._push(last_fetched, target)
                     self._condition.notify()
-            elif event == ProviderInstanceRegistryEvent.REMOVE:
-                self._provider_instances = SortedList(
-                    [p for p in self._provider_instances if p[1] != target]
-                )
+        elif event == ProviderInstanceRegistryEvent.REMOVE:
+            with self._condition:
+                self._discard(target)
 
     def start(self) -> None:
         """Starts the provider queue processing thread."""
@@ -69,62 +73,60 @@ class ProviderQueue(ProviderInstanceRegistryObserver):
         """Stops the provider queue processing thread."""
         self._status = False
         with self._condition:
-            self._condition.notify_all()
+            self._condition.notify()  # the queue thread is the only waiter
 
     def run(self) -> None:
         """Main loop for processing provider instances."""
         with ThreadPoolExecutor(max_workers=FETCHING_THREADS) as executor:
             while self._status:
+                due: List[GenericProvider] = []
+
                 with self._condition:
                     while not self._provider_instances and self._status:
                         LOGGER.info("No providers pending. Sleeping...")
                         self._condition.wait()
 
-                while self._provider_instances:
-                    if self._active_tasks >= FETCHING_THREADS:
-                        LOGGER.info("Thread pool full, waiting for a free slot...")
-                        with self._condition:
-                            self._condition.wait()
-                        break
-
-                    first_entry = self._safe_peek()
-                    if first_entry is None:
-                        break
-
-                    last_fetched, provider_instance_id = first_entry
-                    provider_instance = self._instance_registry.get(provider_instance_id)
-
-                    if not provider_instance:
-                        LOGGER.error(f'Provider instance {provider_instance_id} does not exist in registry!')
-                        with self._condition:
-                            self._provider_instances.pop(0)
-                        continue
-
+                    # Take every due provider instance that fits into the free slots within this one critical section
                     now = datetime.now(tz=timezone.utc)
-                    deltatime = now - last_fetched
-                    time_remaining = FETCHING_TIME - deltatime.total_seconds()
-
-                    if time_remaining > 0:
-                        LOGGER.info(f"Provider {provider_instance.id} not ready. Sleeping for {time_remaining:.2f}s")
-                        with self._condition:
+                    next_due: Optional[Tuple[int, float]] = None  # ID and remaining wait time of the first instance that isn't due yet
+                    while self._provider_instances and self._active_tasks < FETCHING_THREADS:
+                        last_fetched, provider_instance_id = self._provider_instances[0]  # pyright: ignore
+                        time_remaining = FETCHING_TIME - (now - last_fetched).total_seconds()
+                        if time_remaining > 0:
+                            next_due = (provider_instance_id, time_remaining)
+                            break
+
+                        self._discard(provider_instance_id)
+                        provider_instance = self._instance_registry.get(provider_instance_id)
+                        if not provider_instance:
+                            LOGGER.error(f'Provider instance {provider_instance_id} does not exist in registry!')
+                            continue
+
+                        self._active_tasks += 1
+                        due.append(provider_instance)
+
+                    if not due and self._status:
+                        if self._active_tasks >= FETCHING_THREADS:
+                            LOGGER.info("Thread pool full, waiting for a free slot...")
+                            self._condition.wait()
+                        elif next_due is not None:
+                            provider_instance_id, time_remaining = next_due
+                            LOGGER.info(f"Provider {provider_instance_id} not ready. Sleeping for {time_remaining:.2f}s")
                             self._condition.wait(timeout=time_remaining)
-                    else:  # Check again due to changes that may occur during the timeout (for example DELETE events)
-                        with self._condition:
-                            self._provider_instances.pop(0)
-                        self._submit_task(executor, provider_instance)
+
+                for provider_instance in due:
+                    self._submit_task(executor, provider_instance)
 
     def _submit_task(self, executor, provider_instance) -> None:
-        """Submits a task to fetch data from the provider instance and updates active task count with proper synchronization.
+        """Submits a task to fetch data from the provider instance. The caller must have already claimed a slot in the active task count.
 
         Args:
             executor: The ThreadPoolExecutor used to submit tasks.
             provider_instance: The provider instance to run.
         """
-        with self._condition:
-            self._active_tasks += 1
-
         def task_wrapper() -> None:
             """Executes provider fetching and manages task tracking."""
+            success = False
             try:
                 success = provider_instance.run()
                 if success:
@@ -132,25 +134,51 @@ class ProviderQueue(ProviderInstanceRegistryObserver):
                 else:
                     LOGGER.error(f'Fetching {provider_instance.id} failed.')
             finally:
+                # A failed run is retried FETCHING_TIME after the attempt rather than right away,
+                # so e.g. a wrong password doesn't turn into a flood of logins against the server
+                last_fetched = provider_instance.last_fetched if success else datetime.now(tz=timezone.utc)
+                # Instances removed from the registry while they were running are not queued again
+                still_registered = self._instance_registry.get(provider_instance.id) is provider_instance
+                if still_registered and provider_instance.last_fetched is None:
+                    # Its database row is gone (see update_last_fetched), every further run would fail right away
+                    LOGGER.error(f'Provider instance {provider_instance.id} lost its database row, dropping it from the queue.')
+                    still_registered = False
+
+                # Free the slot and re-insert provider with updated last_fetched in one critical section
                 with self._condition:
                     self._active_tasks -= 1
-                    self._condition.notify()
-
-                # Re-insert provider with updated last_fetched
-                with self._condition:
-                    last_fetched = provider_instance.last_fetched or datetime.min
-                    self._provider_instances.add((last_fetched, provider_instance.id))
+                    if still_registered and last_fetched is not None:
+                        self._push(last_fetched, provider_instance.id)
                     self._condition.notify()
 
         executor.submit(task_wrapper)
 
-    def _safe_peek(self) -> Tuple[datetime, int] | None:
-        """Safely gets the first element from the sorted list, handling potential type issues.
+    def _push(self, last_fetched: datetime, provider_instance_id: int) -> None:
+        """Queues a provider instance, replacing its previous entry. Must be called while holding the condition.
+
+        Args:
+            last_fetched (datetime): The time the provider instance was fetched last.
+            provider_instance_id (int): The ID of the provider instance.
+        """
+        self._discard(provider_instance_id)
+        entry = (last_fetched, provider_instance_id)
+        self._entries[provider_instance_id] = entry
+        self._provider_instances.add(entry)
+
+    def _discard(self, provider_instance_id: int) -> bool:
+        """Removes a provider instance from the queue in O(log n). Must be called while holding the condition.
+
+        Args:
+            provider_instance_id (int): The ID of the provider instance.
 
         Returns:
-            Tuple[datetime, int] | None: The first element as a tuple of last fetched time and provider instance ID, or None if empty.
+            bool: True if the provider instance was queued, False otherwise.
         """
-        with self._condition:
-            if self._provider_instances:
-                return self._provider_instances[0]  # pyright: ignore
-            return None
+        entry = self._entries.pop(provider_instance_id, None)
+        if entry is None:
+            return False
+        self._provider_instances.remove(entry)
+        return True
+
+# Module imports are serialized by the import lock, so this can't race like a lazily created instance
+ProviderQueue._GLOBAL_INSTANCE = ProviderQueue(ProviderInstanceRegistry.instance())
@@ -1,14 +1,18 @@
 from datetime import datetime
 import re
-from typing import List
+from typing import Dict, List
+from sqlalchemy import insert
 from globals import DB_SESSION
 from provider.utils.tokenizer import clean_text, split_text_into_sentence_groups
 from provider.utils.translator import translate_to_english
 from env import EMBEDDING_TOKEN_LIMIT
-from schema.connections.provider_instance import ProviderInstance
 from schema.document.document import Document
 from schema.document.sub_document import SubDocument
 
+_URL_RE = re.compile(r'https?://\S+|www\.\S+')
+_LINK_PLACEHOLDER = 'LINK_PLACEHOLDER'
+_LINK_PLACEHOLDER_RE = re.compile(_LINK_PLACEHOLDER)
+
 class ProcessedDocument():
     def __init__(self, id: int, data: str):
         self._id = id
@@ -24,6 +28,124 @@ class ProcessedDocument():
         """The data property."""
         return self._data
 
+class PreprocessedDocument():
+    """A document that went through the text processing steps of the pipeline but has not been persisted yet."""
+    def __init__(self, document: Dict, sentences_with_links: List[str], sentences_without_links: List[str]):
+        self._document = document
+        self._sentences_with_links = sentences_with_links
+        self._sentences_without_links = sentences_without_links
+
+    @property
+    def document(self) -> Dict:
+        """The column values of the Document row."""
+        return self._document
+
+    @property
+    def sentences_with_links(self) -> List[str]:
+        """The sentence groups including their original URLs, as stored in the database."""
+        return self._sentences_with_links
+
+    @property
+    def sentences_without_links(self) -> List[str]:
+        """The sentence groups without URLs."""
+        return self._sentences_without_links
+
+def preprocess(content: str,
+               provider_instance_id: int,
+               doc_type: str,
+               status: str,
+               title: str,
+               author: str,
+               author_avatar: str,
+               url: str,
+               location: str,
+               timestamp: datetime
+               ) -> PreprocessedDocument:
+    """
+    Runs the text processing steps of the pipeline without touching the database.
+
+    URLs are replaced with placeholders, the text is cleaned, translated to English,
+    split into token-limited sentence groups and the URLs are reinserted afterwards.
+
+    Args:
+        See `pipeline`.
+
+    Returns:
+        PreprocessedDocument: The document row values and its sentence groups, ready to be passed to `persist`.
+    """
+
+    # Store and remove links in a single pass
+    links: List[str] = []
+    content = _URL_RE.sub(lambda m: links.append(m.group(0)) or _LINK_PLACEHOLDER, content)
+    
+    content = translate_to_english(clean_text(content))
+    sentences = split_text_into_sentence_groups(content, EMBEDDING_TOKEN_LIMIT)
+
+
+    # Remove placeholders
+    sentences_without_links = [group.replace(_LINK_PLACEHOLDER, '') for group in sentences]
+
+    # Insert links instead of placeholders, unexpected placeholders without a corresponding link are dropped
+    link_iter = iter(links)
+    sentences_with_links = [_LINK_PLACEHOLDER_RE.sub(lambda _: next(link_iter, ''), group) for group in sentences]
+
+    document = {
+        "provider_instance_id": provider_instance_id,
+        "doc_type": doc_type,
+        "status": status,
+        "title": title,
+        "author": author,
+        "author_avatar": author_avatar,
+        "url": url,
+        "location": location,
+        "timestamp": timestamp,
+    }
+    return PreprocessedDocument(document, sentences_with_links, sentences_without_links)
+
+def persist(documents: List[PreprocessedDocument]) -> List[List[ProcessedDocument]]:
+    """
+    Persists preprocessed documents and their sub-documents within a single transaction.
+
+    All documents are written with one multi-row INSERT and all sub-documents with another,
+    both returning the ids assigned by the database in insertion order.
+
+    Args:
+        documents: Documents as returned by `preprocess`
+
+    Returns:
+        List[List[ProcessedDocument]]: The processed sub-documents of every document, in the order of `documents`.
+    """
+    if not documents:
+        return []
+
+    with DB_SESSION() as session:
+        doc_ids = list(session.execute(
+            insert(Document).returning(Document.id, sort_by_parameter_order=True),
+            [document.document for document in documents]
+        ).scalars())
+
+        sub_doc_rows = [
+            {"data": sentence, "document_id": doc_id}
+            for doc_id, document in zip(doc_ids, documents)
+            for sentence in document.sentences_with_links
+        ]
+
+        sub_doc_ids: List[int] = []
+        if sub_doc_rows:
+            sub_doc_ids = list(session.execute(
+                insert(SubDocument).returning(SubDocument.id, sort_by_parameter_order=True),
+                sub_doc_rows
+            ).scalars())
+
+        session.commit()
+
+    # Hand the sub-document ids back to the documents they belong to
+    sub_doc_id_iter = iter(sub_doc_ids)
+    return [
+        [ProcessedDocument(next(sub_doc_id_iter), data) for data in document.sentences_without_links]
+        for document in documents
+    ]
+
 def pipeline(content: str,
              provider_instance_id: int,
              doc_type: str,
@@ -72,57 +194,4 @@ def pipeline(content: str,
         - Documents and sub-documents are persisted to the database
         - Returns sub-document data both with and without URLs for different use cases
     """
-
-    # Store and remove links
-    links = re.findall(r'https?://\S+|www\.\S+', content)
-    content = re.sub(r'https?://\S+|www\.\S+', 'LINK_PLACEHOLDER', content)
-    
-    content = translate_to_english(clean_text(content))
-    sentences = split_text_into_sentence_groups(content, EMBEDDING_TOKEN_LIMIT)
-
-
-    # Remove placeholders
-    sentences_without_links = [group.replace('LINK_PLACEHOLDER', '') for group in sentences]
-
-    current_link_idx = 0
-    sentences_with_links = []
-
-    # Insert links instead of placeholders
-    for group in sentences:
-        parts = group.split('LINK_PLACEHOLDER')
-        reconstructed: List[str] = []
-        for i in range(len(parts)):
-            reconstructed.append(parts[i])
-            if i < len(parts) - 1:
-                if current_link_idx < len(links):
-                    reconstructed.append(links[current_link_idx])
-                    current_link_idx += 1
-                else:
-                    # Handle unexpected placeholder without a corresponding link
-                    reconstructed.append('')
-        sentences_with_links.append(' '.join(reconstructed))
-
-    # Insert everything into place
-    sub_docs: List[SubDocument] = []
-    processed_documents: List[ProcessedDocument] = []
-
-    with DB_SESSION() as session:
-        origin = session.query(ProviderInstance).filter_by(id=provider_instance_id).first()
-        doc = Document(doc_type=doc_type, status=status, title=title, author=author, author_avatar=author_avatar, url=url, location=location, timestamp=timestamp, origin=origin)  
-        session.add(doc)
-
-        for sentence in sentences_with_links:
-            sub_doc = SubDocument(data=sentence, document=doc)
-            sub_docs.append(sub_doc)
-            session.add(sub_doc)
-            
-        session.commit()
-       # Refresh sub-documents to load ids and re-attach them to the session
-        for sub_doc in sub_docs:
-            session.refresh(sub_doc)
-
-    # Processed documents are created in the aftermath due to the DB commit assigning ids
-    for idx, sub_doc in enumerate(sub_docs):
-        processed_documents.append(ProcessedDocument(sub_doc.id, sentences_without_links[idx]))
- 
-    return processed_documents
+    return persist([preprocess(content, provider_instance_id, doc_type, status, title, author, author_avatar, url, location, timestamp)])[0]
@@ -1,6 +1,34 @@
+from bisect import bisect_right
 import re
-from typing import List
-from nltk.tokenize import sent_tokenize, word_tokenize
+import sys
+from threading import Lock
+from functools import lru_cache
+from itertools import accumulate
+from typing import List, Sequence
+import spacy
+from transformers import AutoTokenizer
+from env import EMBEDDING_MODEL
+
+# Blank English pipeline with the rule-based sentencizer, no statistical model required
+_NLP = spacy.blank("en")
+_NLP.add_pipe("sentencizer")
+# The length limit guards the memory of the parser and NER models, the rule-based sentencizer doesn't need it
+_NLP.max_length = sys.maxsize
+# Memory zones of the shared pipeline must not overlap, so splits from the processing threads are serialized
+_NLP_LOCK = Lock()
+
+
+# Translation table used by clean_text: removes non-printable/control Unicode characters (e.g., \u200c, \u200b, etc.)
+# and turns carriage returns, newlines and tabs into spaces
+_CLEAN_TABLE = {
+    **{c: None for r in (range(0x00, 0x20), range(0x7F, 0xA0), range(0x200B, 0x2010), range(0x202A, 0x202F)) for c in r},
+    **str.maketrans({'\r': ' ', '\n': ' ', '\t': ' '}),
+}
+
+# Patterns used by clean_text, compiled once
+_RE_WS = re.compile(r'\s+')
+# Matches whole runs of punctuation, so "..." and "?!" stay together
+_RE_PUNCT_SPACE = re.compile(r'\s*([,.!?;]+)\s*')
 
 def clean_text(text: str) -> str:
     """
@@ -18,23 +46,64 @@ def clean_text(text: str) -> str:
         'Hello, world!'
     """
 
-    # Remove non-printable/control Unicode characters (e.g., \u200c, \u200b, etc.)
-    # \p{C} matches all Unicode "Other" categories (control, format, surrogate, etc.)
-    text = re.sub(r'[\u0000-\u001F\u007F-\u009F\u200B-\u200F\u202A-\u202E]', '', text)
-    # Remove carriage return, newline, and tab characters
-    text = text.replace('\r', ' ').replace('\n', ' ').replace('\t', ' ')
+    # Remove control characters and replace carriage returns, newlines and tabs in a single pass
+    text = text.translate(_CLEAN_TABLE)
 
     # Clean extra spaces and adjust spacing around punctuation
-    text = text.strip()
-    text = re.sub(r'\s+', ' ', text)  # Replace multiple spaces with one
-    text = re.sub(r'\s*([,.!?;])\s*', r'\1 ', text)  # Adjust spaces around punctuation
-    text = re.sub(r'\s*([,.!?;])', r'\1', text)  # Ensure no space before punctuation
+    text = _RE_WS.sub(' ', text)  # Replace multiple spaces with one
+    text = _RE_PUNCT_SPACE.sub(r'\1 ', text)  # Adjust spaces around punctuation, also ensures no space before punctuation
+    text = text.strip()  # Strip once at the end, this also drops the space added after trailing punctuation
 
     return text
 
+# Splits an oversized sentence into words and punctuation marks
+_WORD_RE = re.compile(r"\w+|[^\w\s]")
+
+def _split_sentences(text: str) -> List[str]:
+    """
+    Splits text into sentences.
+
+    Args:
+        text (str): The text to split.
+
+    Returns:
+        - List of the sentences.
+    """
+    # Strings added to the vocab within the memory zone are freed again, so the vocab doesn't grow with every new text
+    with _NLP_LOCK, _NLP.memory_zone():
+        return [sent.text for sent in _NLP(text).sents]
+
+@lru_cache(maxsize=None)
+def _get_tokenizer():
+    """
+    Loads the fast (Rust-backed) tokenizer of the embedding model on first use,
+    so importing this module doesn't pay for loading it.
+
+    Returns:
+        - The tokenizer, used to count the tokens the model will actually consume.
+    """
+    return AutoTokenizer.from_pretrained(EMBEDDING_MODEL, use_fast=True)
+
+def _count_tokens(texts: Sequence[str]) -> List[int]:
+    """
+    Counts the model tokens of every text in one batched tokenizer call.
+
+    Args:
+        texts (Sequence[str]): The texts to count the tokens of.
+
+    Returns:
+        - List of token counts, in the order of `texts`. Special tokens are not included.
+    """
+    if not texts:
+        return []
+    return [len(ids) for ids in _get_tokenizer()(list(texts), add_special_tokens=False)["input_ids"]]
+
 def split_text_into_sentence_groups(text: str, token_limit: int) -> List[str]:
     """
-    Splits input text into sentences and and groups them.
+    Splits input text into sentences using spaCy's sentencizer and groups them.
+
+    Sentences are packed by their token count as given by the tokenizer of the embedding model,
+    so the groups line up with what the model will actually consume.
 
     Args:
         text (str): The text to split. It's recommended to replace the links with placeholders beforehand!
@@ -47,41 +116,30 @@ def split_text_into_sentence_groups(text: str, token_limit: int) -> List[str]:
         >>> split_text_into_sentence_groups(("Hello! How are you? Visit PLACEHOLDER for more info.", 6)
         (['Hello! How are you?', 'Visit PLACEHOLDER for more info.'])
     """
-    sentences: List[str] = sent_tokenize(text)
+    # Oversized sentences are split into words, so every piece fits within the limit on its own
+    pieces: List[str] = []
+    piece_tokens: List[int] = []
+
+    sentences = _split_sentences(text)
+    for sentence, tokens in zip(sentences, _count_tokens(sentences)):
+        if tokens <= token_limit:
+            pieces.append(sentence)
+            piece_tokens.append(tokens)
+        else:
+            words = _WORD_RE.findall(sentence)
+            pieces.extend(words)
+            piece_tokens.extend(_count_tokens(words))
 
+    # Greedy packing: with the running token totals, each group ends at the last piece that still fits,
+    # found by a binary search instead of checking piece by piece
+    totals = [0, *accumulate(piece_tokens)]
     sentence_groups: List[str] = []
 
-    curr_sentence_group: List[str] = []
-    curr_group_tokens = 0
-
-    for sentence in sentences:
-        # make sure that one individual sentence doesnt max out the token limit
-        if len(sentence) <= token_limit:
-            if curr_group_tokens + len(sentence) <= token_limit:
-                curr_sentence_group.append(sentence)
-                curr_group_tokens += len(sentence)
-            else:
-                sentence_groups.append(' '.join(curr_sentence_group))
-                curr_group_tokens = len(sentence)
-                curr_sentence_group = [sentence]
-        else:
-            words = word_tokenize(sentence)
-            if curr_group_tokens:
-                sentence_groups.append(' '.join(curr_sentence_group))
-                curr_group_tokens = len(words)
-                curr_sentence_group = []
-
-            for word in words:
-                if curr_group_tokens + len(word) <= token_limit:
-                    curr_sentence_group.append(word)
-                    curr_group_tokens += len(word)
-                else:
-                    sentence_groups.append(' '.join(curr_sentence_group))
-                    curr_group_tokens = len(word)
-                    curr_sentence_group = [word]
-
-
-    if curr_sentence_group:
-        sentence_groups.append(' '.join(curr_sentence_group))
+    start = 0
+    while start < len(pieces):
+        end = bisect_right(totals, totals[start] + token_limit) - 1
+        end = max(end, start + 1)  # a single word above the limit still ends up in its own group
+        sentence_groups.append(' '.join(pieces[start:end]))
+        start = end
 
     return sentence_groups
@@ -19,4 +19,5 @@ class ProviderInstance(Base):
     last_fetched: Mapped[datetime] = mapped_column(DateTime, default=datetime.min.replace(tzinfo=timezone.utc))
     data: Mapped[dict] = mapped_column(JSON)  # schema has to be equal to @Provider.input_data
     provider: Mapped["Provider"] = relationship("Provider", back_populates="instances")
-    documents: Mapped[list[Document]] = relationship("Document", back_populates="origin", cascade="all, delete-orphan")
+    # Documents are removed by the ON DELETE CASCADE foreign key instead of being loaded and deleted one by one
+    documents: Mapped[list[Document]] = relationship("Document", back_populates="origin", cascade="all, delete-orphan", passive_deletes=True)
@@ -23,5 +23,5 @@ class Document(Base):
     timestamp: Mapped[DateTime] = mapped_column(DateTime)
     origin: Mapped["ProviderInstance"] = relationship("ProviderInstance", back_populates="documents")
     sub_documents: Mapped[list["SubDocument"]] = relationship(
-        "SubDocument", back_populates="document", cascade="all, delete-orphan"
+        "SubDocument", back_populates="document", cascade="all, delete-orphan", passive_deletes=True
     )
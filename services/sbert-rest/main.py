@@ -1,21 +1,157 @@
-from fastapi import FastAPI, Body
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Body, Response
+import numpy as np
+import orjson
+import grpc
 from pydantic import BaseModel
-from typing import List
+from typing import List, Tuple
 from sentence_transformers import SentenceTransformer
 from transformers import AutoTokenizer
+import torch
 import uvicorn
 
+# Number of uvicorn worker processes, each one loads its own copy of the model
+WORKERS = int(os.getenv("WORKERS", "1"))
+# Intra-op threads per worker, defaults to splitting the physical CPU cores (assuming 2 threads per core) evenly between the workers
+TORCH_THREADS = int(os.getenv("TORCH_THREADS", str(max(1, (os.cpu_count() or 2) // 2 // WORKERS))))
+
+# Port of the gRPC server running alongside the HTTP API
+GRPC_PORT = int(os.getenv("GRPC_PORT", "50051"))
+
+# Messages and service stubs are generated from embed.proto at import time
+embed_pb2, embed_pb2_grpc = grpc.protos_and_services("embed.proto")
+
+# Models are loaded by every worker in the lifespan handler, not at import,
+# so the supervising process started through __main__ never holds a copy of the weights
+model_name = "sentence-transformers/paraphrase-MiniLM-L12-v2"
+model: SentenceTransformer
+tokenizer: AutoTokenizer
+# Separate instance for the micro-batch token budget. A fast tokenizer carries its truncation settings as mutable state,
+# so sharing it with /tokenize would toggle them between concurrent calls
+budget_tokenizer: AutoTokenizer
+
+def load_models():
+    global model, tokenizer, budget_tokenizer
+    model = SentenceTransformer(model_name)
+    model.max_seq_length = 128
+
+    if model.device.type == "cuda":
+        # A GPU runs the encoder in half precision on its tensor cores
+        model = model.half()
+    elif os.getenv("QUANTIZE_INT8", "1") == "1":
+        # Quantize the linear layers to int8 for CPU inference, set QUANTIZE_INT8=0 to keep full FP32 weights
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    budget_tokenizer = AutoTokenizer.from_pretrained(model_name)
+
+# === Micro-batching ===
+# Concurrent /embed requests are coalesced into a single model.encode call.
+# A batch is closed once it holds MAX_BATCH_TOKENS tokens or MAX_WAIT_MS passed since its first request.
+MAX_BATCH_TOKENS = 8192
+MAX_WAIT_MS = 10
+# Texts per forward pass within a batch
+ENCODE_BATCH_SIZE = 64
+
+embed_queue: "asyncio.Queue[Tuple[asyncio.Future, List[str], int]]"
+
+async def batch_worker(queue: "asyncio.Queue[Tuple[asyncio.Future, List[str], int]]"):
+    loop = asyncio.get_running_loop()
+    while True:
+        future, texts, tokens = await queue.get()
+        batch = [(future, texts)]
+        batch_tokens = tokens
+        deadline = loop.time() + MAX_WAIT_MS / 1000
+
+        while batch_tokens < MAX_BATCH_TOKENS:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                future, texts, tokens = await asyncio.wait_for(queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            batch.append((future, texts))
+            batch_tokens += tokens
+
+        all_texts = [text for _, texts in batch for text in texts]
+        try:
+            embeddings = await asyncio.to_thread(
+                model.encode,
+                all_texts,
+                batch_size=min(len(all_texts), ENCODE_BATCH_SIZE),
+                convert_to_numpy=True,
+                normalize_embeddings=True  # unit length, so the cosine similarity is a plain dot product
+            )
+        except Exception as e:
+            for future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            continue
+
+        # Hand every request its slice of the batch
+        offset = 0
+        for future, texts in batch:
+            if not future.done():
+                future.set_result(embeddings[offset:offset + len(texts)])
+            offset += len(texts)
+
+async def encode_batched(texts: List[str]) -> np.ndarray:
+    # Tokenize off the event loop, so it overlaps with the batch currently being encoded
+    lengths = (await asyncio.to_thread(budget_tokenizer, texts, return_length=True))["length"]
+    # Tokens beyond max_seq_length are truncated away by the model, so they don't count towards the batch
+    tokens = sum(min(length, model.max_seq_length) for length in lengths)
+    future = asyncio.get_running_loop().create_future()
+    await embed_queue.put((future, texts, tokens))
+    return await future
+
+# === gRPC ===
+class EmbedServicer(embed_pb2_grpc.EmbedderServicer):
+    async def Embed(self, request, context):
+        texts = [doc.content for doc in request.documents]
+        embeddings = np.ascontiguousarray(await encode_batched(texts), dtype="<f4") if texts else []
+
+        return embed_pb2.EmbedResponse(
+            embeddings=[
+                embed_pb2.Embedding(id=doc.id, vector=emb.tobytes())
+                for doc, emb in zip(request.documents, embeddings)
+            ],
+            dimension=model.get_sentence_embedding_dimension()
+        )
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global embed_queue
+    # Set here rather than at import, since the module is imported more than once per process
+    # (as __main__/__mp_main__ and as main) and the interop threads can only be set once
+    torch.set_num_threads(TORCH_THREADS)
+    # A single encoder forward pass has no independent ops to run in parallel
+    torch.set_num_interop_threads(1)
+
+    await asyncio.to_thread(load_models)
+
+    embed_queue = asyncio.Queue()
+    worker = asyncio.create_task(batch_worker(embed_queue))
+
+    grpc_server = grpc.aio.server()
+    embed_pb2_grpc.add_EmbedderServicer_to_server(EmbedServicer(), grpc_server)
+    grpc_server.add_insecure_port(f"[::]:{GRPC_PORT}")
+    await grpc_server.start()
+
+    yield
+
+    await grpc_server.stop(grace=None)
+    worker.cancel()
+
 app = FastAPI(
     title="Sentence-BERT API",
     description="FastAPI app for Sentence-BERT embedding and tokenization",
-    version="1.1.0"
+    version="1.1.0",
+    lifespan=lifespan
 )
 
-# Load models
-model_name = "sentence-transformers/paraphrase-MiniLM-L12-v2"
-model = SentenceTransformer(model_name)
-tokenizer = AutoTokenizer.from_pretrained(model_name)
-
 # === Schemas ===
 class Document(BaseModel):
     id: str
@@ -36,28 +172,52 @@ def root():
     return {"message": "Sentence-BERT API is online."}
 
 @app.post("/embed", response_model=List[EmbeddingResponse], tags=["Embedding"])
-def embed(documents: List[Document]):
+async def embed(documents: List[Document]):
     texts = [doc.content for doc in documents]
-    embeddings = model.encode(texts)
+    if not texts:
+        return []
 
-    return [
-        EmbeddingResponse(id=doc.id, vector=emb.tolist())
-        for doc, emb in zip(documents, embeddings)
-    ]
+    embeddings = await encode_batched(texts)
+
+    # Returning the response directly skips the per-vector validation of response_model,
+    # orjson serializes the numpy rows natively without converting them to lists first
+    return Response(
+        content=orjson.dumps(
+            [{"id": doc.id, "vector": emb} for doc, emb in zip(documents, embeddings)],
+            option=orjson.OPT_SERIALIZE_NUMPY
+        ),
+        media_type="application/json"
+    )
+
+@app.post("/embed-bytes", tags=["Embedding"], response_class=Response)
+async def embed_bytes(documents: List[Document]):
+    """
+    Returns the embeddings as one little-endian float32 buffer, one row per document in request order.
+    The number of rows and the embedding dimension are sent in the X-Embedding-Count and X-Embedding-Dimension headers.
+    """
+    dimension = model.get_sentence_embedding_dimension()
+    texts = [doc.content for doc in documents]
+    embeddings = await encode_batched(texts) if texts else np.empty((0, dimension))
+
+    return Response(
+        content=np.ascontiguousarray(embeddings, dtype="<f4").tobytes(),
+        media_type="application/octet-stream",
+        headers={
+            "X-Embedding-Count": str(len(texts)),
+            "X-Embedding-Dimension": str(dimension)
+        }
+    )
 
 @app.post("/tokenize", response_model=List[TokenizationResponse], tags=["Tokenization"])
 def tokenize(documents: List[Document]):
     texts = [doc.content for doc in documents]
-    tokens = tokenizer(texts, padding="max_length", truncation=True, return_tensors="pt")
+    # No padding, every document only gets its own tokens, truncated to what the model consumes
+    tokens = tokenizer(texts, truncation=True, max_length=model.max_seq_length)
 
-    results = []
-    for i, doc in enumerate(documents):
-        results.append(TokenizationResponse(
-            id=doc.id,
-            input_ids=tokens["input_ids"][i].tolist(),
-            attention_mask=tokens["attention_mask"][i].tolist()
-        ))
-    return results
+    return [
+        TokenizationResponse(id=doc.id, input_ids=input_ids, attention_mask=attention_mask)
+        for doc, input_ids, attention_mask in zip(documents, tokens["input_ids"], tokens["attention_mask"])
+    ]
 
 @app.get("/metadata", tags=["Metadata"])
 def get_metadata():
@@ -67,5 +227,5 @@ def get_metadata():
 
 # === Auto-run if executed directly ===
 if __name__ == "__main__":
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
+    uvicorn.run("main:app", host="0.0.0.0", port=8000, workers=WORKERS)
 